@@ -82,7 +82,7 @@ DOCUMENTATION = """
         default: ''
         description:
             - Proxy information for running the connection via a jumphost.
-            - Also this plugin will scan 'ssh_args', 'ssh_extra_args' and 'ssh_common_args' from the 'ssh' plugin settings for proxy information if set.
+            - When this option is not set, this plugin will scan 'ssh_args', 'ssh_extra_args' and 'ssh_common_args' from the 'ssh' plugin settings for proxy information.
         type: string
         env:
           - name: ANSIBLE_LIBSSH_PROXY_COMMAND
@@ -131,6 +131,7 @@ DOCUMENTATION = """
           description:
            - Arguments to pass to all ssh CLI tools.
            - ProxyCommand is the only supported argument.
+           - Ignored when I(proxy_command) is set.
            - This option is deprecated in favor of I(proxy_command) and will be removed
              in a release after 2026-01-01.
           type: string
@@ -148,6 +149,7 @@ DOCUMENTATION = """
           description:
            - Common extra arguments for all ssh CLI tools.
            - ProxyCommand is the only supported argument.
+           - Ignored when I(proxy_command) is set.
            - This option is deprecated in favor of I(proxy_command) and will be removed
              in a release after 2026-01-01.
           type: string
@@ -165,6 +167,7 @@ DOCUMENTATION = """
           description:
            - Extra arguments exclusive to the 'ssh' CLI tool.
            - ProxyCommand is the only supported argument.
+           - Ignored when I(proxy_command) is set.
            - This option is deprecated in favor of I(proxy_command) and will be removed
              in a release after 2026-01-01.
           type: string
@@ -191,18 +194,24 @@ DOCUMENTATION = """
 # TODO:
 #timeout=self._play_context.timeout,
 """
+import collections
+import functools
 import logging
 import os
 import re
 import socket
 import sys
+import threading
 
+from pathlib import Path
 from termios import TCIFLUSH, tcflush
 
 from ansible.errors import AnsibleConnectionFailure, AnsibleError, AnsibleFileNotFound
 from ansible.module_utils._text import to_bytes, to_native, to_text
 from ansible.module_utils.basic import missing_required_lib
+from ansible.module_utils.six import string_types
 from ansible.module_utils.six.moves import input
+from ansible.plugins.become import BecomeBase
 from ansible.plugins.connection import ConnectionBase
 from ansible.utils.display import Display
 
@@ -220,6 +229,9 @@ try:
 except ImportError:
     HAS_PYLIBSSH = False
 
+# password_prompt requires ansible-pylibssh 1.0.0 or newer
+_PYLIBSSH_LT_1 = bool(HAS_PYLIBSSH and Version(PYLIBSSH_VERSION) < "1.0.0")
+
 
 AUTHENTICITY_MSG = """
 libssh: The authenticity of host '%s' can't be established due to '%s'.
@@ -227,8 +239,13 @@ The %s key fingerprint is %s.
 Are you sure you want to continue connecting (yes/no)?
 """
 
-# SSH Options Regex
-SETTINGS_REGEX = re.compile(r"(\w+)(?:\s*=\s*|\s+)(.+)")
+# SSH Options Regex, matched against ssh args joined one per line
+SETTINGS_REGEX = re.compile(
+    r"^(proxycommand)(?:[ \t]*=[ \t]*|\s+)(.+)$", re.IGNORECASE | re.MULTILINE
+)
+
+# ProxyCommand placeholders for the host, port and remote user
+PROXY_PLACEHOLDER_REGEX = re.compile(r"%[hpr]")
 
 
 class MyAddPolicy(object):
@@ -244,15 +261,14 @@ class MyAddPolicy(object):
     def __init__(self, new_stdin, connection):
         self._new_stdin = new_stdin
         self.connection = connection
-        self._options = connection._options
+        # the policy is created per connect, after the options are set
+        self._prompt = bool(
+            connection.get_option("host_key_checking")
+            and not connection.get_option("host_key_auto_add")
+        )
 
     def missing_host_key(self, session, hostname, username, key_type, fingerprint, message):
-        if all(
-            (
-                self._options["host_key_checking"],
-                not self._options["host_key_auto_add"],
-            )
-        ):
+        if self._prompt:
             if (
                 self.connection.get_option("use_persistent_connections")
                 or self.connection.force_persistence
@@ -286,6 +302,66 @@ class MyAddPolicy(object):
 # keep connection objects on a per host basis to avoid repeated attempts to reconnect
 SSH_CONNECTION_CACHE = {}
 SFTP_CONNECTION_CACHE = {}
+# serialize connecting per cache key so concurrent workers share one handshake
+_CACHE_LOCKS = collections.defaultdict(threading.Lock)
+# keep private key contents per path, with the mtime and size they were read at,
+# so hosts sharing a key read it once
+_PRIVATE_KEY_CACHE = {}
+
+
+def _load_private_key(path):
+    """Return the contents of the private key file at path, rereading it when it changes."""
+    st = os.stat(path)
+    cached = _PRIVATE_KEY_CACHE.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    private_key = Path(path).read_bytes()
+    _PRIVATE_KEY_CACHE[path] = (st.st_mtime_ns, st.st_size, private_key)
+    return private_key
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_proxy_from_ssh_args(ssh_args):
+    """Return the ProxyCommand set in a joined ssh_*_args string, if any.
+
+    The ssh_*_args options are usually identical for every host in a play,
+    so the parsed result is cached per unique string.
+    """
+    # Splitting honours quoting; a single regex pass over the tokens then finds
+    # both "ProxyCommand=cmd" and "ProxyCommand" followed by "cmd" as its own token
+    args = "\n".join(ConnectionBase._split_ssh_args(ssh_args))
+    match = SETTINGS_REGEX.search(args)
+    return match.group(2) if match else None
+
+
+def _become_output_regex(become):
+    """Compile the BecomeBase success and password prompt checks into one regex.
+
+    Returns None when the become plugin overrides either check, in which case
+    its own methods have to be called on every line of output instead.
+    """
+    become_cls = type(become)
+    if (
+        getattr(become_cls, "check_success", None) is not BecomeBase.check_success
+        or getattr(become_cls, "check_password_prompt", None)
+        is not BecomeBase.check_password_prompt
+    ):
+        return None
+
+    if not become.success or not isinstance(become.prompt, (string_types, type(None))):
+        return None
+
+    b_success = to_bytes(become.success, errors="surrogate_or_strict")
+    patterns = [b"(?P<success>" + re.escape(b_success) + b")"]
+    if become.prompt:
+        b_prompt = to_bytes(become.prompt, errors="surrogate_or_strict").strip()
+        if not b_prompt:
+            return None
+        # a line that starts with the prompt once leading whitespace is stripped
+        patterns.append(
+            rb"(?P<prompt>(?:\A|(?<=[\r\n]))[ \t\x0b\x0c]*" + re.escape(b_prompt) + b")"
+        )
+    return re.compile(b"|".join(patterns))
 
 
 class Connection(ConnectionBase):
@@ -294,6 +370,40 @@ class Connection(ConnectionBase):
     transport = "ansible.netcommon.libssh"
     _log_channel = None
 
+    # options read when connecting, fetched together by _opts()
+    _connect_options = (
+        "remote_user",
+        "remote_addr",
+        "look_for_keys",
+        "host_key_checking",
+        "password",
+        "password_prompt",
+        "config_file",
+        "proxy_command",
+        "ssh_args",
+        "ssh_common_args",
+        "ssh_extra_args",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(Connection, self).__init__(*args, **kwargs)
+        self._proxy_command_cache = {}
+        self._opt_cache = None
+
+    def set_options(self, *args, **kwargs):
+        super(Connection, self).set_options(*args, **kwargs)
+        self._opt_cache = None
+
+    def set_option(self, *args, **kwargs):
+        super(Connection, self).set_option(*args, **kwargs)
+        self._opt_cache = None
+
+    def _opts(self):
+        """Return the connect options, fetched once until they are set again."""
+        if self._opt_cache is None:
+            self._opt_cache = {option: self.get_option(option) for option in self._connect_options}
+        return self._opt_cache
+
     def _cache_key(self):
         return "%s__%s__" % (
             self._play_context.remote_addr,
@@ -302,54 +412,64 @@ class Connection(ConnectionBase):
 
     def _connect(self):
         cache_key = self._cache_key()
-        if cache_key in SSH_CONNECTION_CACHE:
-            self.ssh = SSH_CONNECTION_CACHE[cache_key]
-        else:
-            self.ssh = SSH_CONNECTION_CACHE[cache_key] = self._connect_uncached()
+        ssh = SSH_CONNECTION_CACHE.get(cache_key)
+        if ssh is None:
+            with _CACHE_LOCKS[cache_key]:
+                # another thread may have connected while we waited for the lock
+                ssh = SSH_CONNECTION_CACHE.get(cache_key)
+                if ssh is None:
+                    ssh = SSH_CONNECTION_CACHE[cache_key] = self._connect_uncached()
+        self.ssh = ssh
         return self
 
     def _set_log_channel(self, name):
         self._log_channel = name
 
     def _get_proxy_command(self, port=22):
-        proxy_command = None
+        opts = self._opts()
+        proxy_command = opts["proxy_command"]
         # Parse ansible_ssh_common_args, specifically looking for ProxyCommand
-        ssh_args = [
-            self.get_option("ssh_extra_args") or "",
-            self.get_option("ssh_common_args") or "",
-            self.get_option("ssh_args") or "",
-        ]
+        ssh_args = (
+            opts["ssh_extra_args"] or "",
+            opts["ssh_common_args"] or "",
+            opts["ssh_args"] or "",
+        )
+        cache_key = (
+            (proxy_command,)
+            + ssh_args
+            + (
+                port,
+                self._play_context.remote_addr,
+                self._play_context.remote_user,
+            )
+        )
+        if cache_key in self._proxy_command_cache:
+            return self._proxy_command_cache[cache_key]
 
         if any(ssh_args):
-            display.warning(
-                "The ssh_*_args options are deprecated and will be removed in a release after 2026-01-01. Please use the proxy_command option instead."
-            )
-            args = self._split_ssh_args(" ".join(ssh_args))
-            for i, arg in enumerate(args):
-                if arg.lower() == "proxycommand":
-                    # _split_ssh_args split ProxyCommand from the command itself
-                    proxy_command = args[i + 1]
-                else:
-                    # ProxyCommand and the command itself are a single string
-                    match = SETTINGS_REGEX.match(arg)
-                    if match:
-                        if match.group(1).lower() == "proxycommand":
-                            proxy_command = match.group(2)
-
-                if proxy_command:
-                    break
-
-        proxy_command = proxy_command or self.get_option("proxy_command")
+            if proxy_command:
+                # proxy_command takes precedence, only tell about a ProxyCommand it overrides
+                if _parse_proxy_from_ssh_args(" ".join(ssh_args)):
+                    display.warning(
+                        "The ProxyCommand set in the ssh_*_args options is ignored because the proxy_command option is set."
+                    )
+            else:
+                display.warning(
+                    "The ssh_*_args options are deprecated and will be removed in a release after 2026-01-01. Please use the proxy_command option instead."
+                )
+                proxy_command = _parse_proxy_from_ssh_args(" ".join(ssh_args))
 
         if proxy_command:
             replacers = {
-                "%h": self._play_context.remote_addr,
-                "%p": port,
-                "%r": self._play_context.remote_user,
+                "%h": str(self._play_context.remote_addr),
+                "%p": str(port),
+                "%r": str(self._play_context.remote_user),
             }
-            for find, replace in replacers.items():
-                proxy_command = proxy_command.replace(find, str(replace))
+            proxy_command = PROXY_PLACEHOLDER_REGEX.sub(
+                lambda match: replacers[match.group(0)], proxy_command
+            )
 
+        self._proxy_command_cache[cache_key] = proxy_command
         return proxy_command
 
     def _connect_uncached(self):
@@ -364,8 +484,9 @@ class Connection(ConnectionBase):
 
         ssh_connect_kwargs = {}
 
-        remote_user = self.get_option("remote_user")
-        remote_addr = self.get_option("remote_addr")
+        opts = self._opts()
+        remote_user = opts["remote_user"]
+        remote_addr = opts["remote_addr"]
         port = self._play_context.port or 22
         display.vvv(
             "ESTABLISH LIBSSH CONNECTION FOR USER: %s on PORT %s TO %s"
@@ -385,17 +506,17 @@ class Connection(ConnectionBase):
         try:
             private_key = None
             if self._play_context.private_key_file:
-                with open(os.path.expanduser(self._play_context.private_key_file)) as fp:
-                    b_content = fp.read()
-                    private_key = to_bytes(b_content, errors="surrogate_or_strict")
+                private_key = _load_private_key(
+                    os.path.expanduser(self._play_context.private_key_file)
+                )
 
             if proxy_command:
                 ssh_connect_kwargs["proxycommand"] = proxy_command
 
-            if self.get_option("config_file"):
-                ssh_connect_kwargs["config_file"] = self.get_option("config_file")
+            if opts["config_file"]:
+                ssh_connect_kwargs["config_file"] = opts["config_file"]
 
-            if self.get_option("password_prompt") and (Version(PYLIBSSH_VERSION) < "1.0.0"):
+            if opts["password_prompt"] and _PYLIBSSH_LT_1:
                 raise AnsibleError(
                     "Configuring password prompt is not supported in ansible-pylibssh version %s. "
                     "Please upgrade to ansible-pylibssh 1.0.0 or newer." % PYLIBSSH_VERSION
@@ -406,10 +527,10 @@ class Connection(ConnectionBase):
             self.ssh.connect(
                 host=remote_addr.lower(),
                 user=remote_user,
-                look_for_keys=self.get_option("look_for_keys"),
-                host_key_checking=self.get_option("host_key_checking"),
-                password=self.get_option("password"),
-                password_prompt=self.get_option("password_prompt"),
+                look_for_keys=opts["look_for_keys"],
+                host_key_checking=opts["host_key_checking"],
+                password=opts["password"],
+                password_prompt=opts["password_prompt"],
                 private_key=private_key,
                 timeout=self._play_context.timeout,
                 port=port,
@@ -445,33 +566,43 @@ class Connection(ConnectionBase):
                 msg += ": %s" % text_e
             raise AnsibleConnectionFailure(to_native(msg))
 
+        # the become prompt is answered through an interactive shell on this
+        # channel, other commands run on a fresh channel of their own
+        expect_prompt = bool(self.become and self.become.expect_prompt())
+
         # sudo usually requires a PTY (cf. requiretty option), therefore
         # we give it one by default (pty=True in ansible.cfg), and we try
         # to initialise from the calling environment when sudoable is enabled
-        if self.get_option("pty") and sudoable:
+        if self.get_option("pty") and sudoable and expect_prompt:
             self.chan.request_shell()
 
         display.vvv("EXEC %s" % cmd, host=self._play_context.remote_addr)
 
-        cmd = to_bytes(cmd, errors="surrogate_or_strict")
-
         result = None
-        no_prompt_out = b""
-        no_prompt_err = b""
-        become_output = b""
+        become_output = bytearray()
         out = b""
         err = b""
 
         try:
-            if self.become and self.become.expect_prompt():
+            if expect_prompt:
                 passprompt = False
                 become_sucess = False
-                self.chan.sendall(cmd)
+                # offset of the first line not yet fully scanned
+                last_scanned = 0
+                become_re = _become_output_regex(self.become)
+                self.chan.sendall(to_bytes(cmd, errors="surrogate_or_strict"))
+
+                # bound once, the loop can go around many times for a lectured prompt
+                poll = self.chan.poll
+                recv = self.chan.recv
+                check_success = self.become.check_success
+                check_password_prompt = self.become.check_password_prompt
+                timeout = self._play_context.timeout
 
                 while not (become_sucess or passprompt):
                     display.debug("Waiting for Privilege Escalation input")
-                    self.chan.poll(timeout=self._play_context.timeout)
-                    chunk = self.chan.recv(bufsize)
+                    poll(timeout=timeout)
+                    chunk = recv(bufsize)
                     display.debug("chunk is: %s" % chunk)
 
                     if not chunk:
@@ -486,16 +617,28 @@ class Connection(ConnectionBase):
                         else:
                             break
                             # raise AnsibleError('ssh connection closed waiting for password prompt')
-                    become_output += chunk
+                    become_output.extend(chunk)
                     # need to check every line because we might get lectured
-                    # and we might get the middle of a line in a chunk
-                    for line in become_output.splitlines(True):
-                        if self.become.check_success(line):
-                            become_sucess = True
-                            break
-                        if self.become.check_password_prompt(line):
-                            passprompt = True
-                            break
+                    # and we might get the middle of a line in a chunk, so only
+                    # complete lines already checked are skipped on the next chunk
+                    if become_re is not None:
+                        match = become_re.search(become_output, last_scanned)
+                        if match:
+                            become_sucess = match.lastgroup == "success"
+                            passprompt = not become_sucess
+                    else:
+                        # copy the unscanned tail once rather than slicing then converting
+                        segment = bytes(memoryview(become_output)[last_scanned:])
+                        for line in segment.splitlines(True):
+                            if check_success(line):
+                                become_sucess = True
+                                break
+                            if check_password_prompt(line):
+                                passprompt = True
+                                break
+                    newline = become_output.rfind(b"\n", last_scanned)
+                    if newline != -1:
+                        last_scanned = newline + 1
                 if passprompt:
                     if self.become:
                         become_pass = self.become.get_option(
@@ -506,13 +649,14 @@ class Connection(ConnectionBase):
                         )
                     else:
                         raise AnsibleError("A password is required but none was supplied")
-                else:
-                    no_prompt_out += become_output
-                    no_prompt_err += become_output
             else:
+                # pylibssh encodes the command itself, keep it as text
                 result = self.chan.exec_command(to_text(cmd, errors="surrogate_or_strict"))
         except socket.timeout:
-            raise AnsibleError("ssh timed out waiting for privilege escalation.\n" + become_output)
+            raise AnsibleError(
+                "ssh timed out waiting for privilege escalation.\n"
+                + to_text(bytes(become_output), errors="surrogate_or_strict")
+            )
 
         if result:
             rc = result.returncode
@@ -537,9 +681,9 @@ class Connection(ConnectionBase):
 
         if proto == "sftp":
             try:
-                self.sftp = self.ssh.sftp()
+                self.sftp = self._connect_sftp()
             except Exception as e:
-                raise AnsibleError("failed to open a SFTP connection (%s)" % e)
+                raise AnsibleError("failed to open a SFTP connection (%s)" % to_native(e))
 
             try:
                 self.sftp.put(
@@ -558,10 +702,23 @@ class Connection(ConnectionBase):
             raise AnsibleError("Don't know how to transfer file over protocol %s" % proto)
 
     def _connect_sftp(self):
-        cache_key = "%s__%s__" % (
-            self._play_context.remote_addr,
-            self._play_context.remote_user,
-        )
+        cache_key = self._cache_key()
+        ssh = SSH_CONNECTION_CACHE.get(cache_key)
+        if ssh is not None and not ssh.is_connected:
+            # the session went away underneath the cached SFTP channel, release
+            # both before starting over
+            sftp = SFTP_CONNECTION_CACHE.pop(cache_key, None)
+            SSH_CONNECTION_CACHE.pop(cache_key, None)
+            if getattr(self, "sftp", None) is sftp:
+                self.sftp = None
+            for handle in (sftp, ssh):
+                if handle is None:
+                    continue
+                try:
+                    handle.close()
+                except Exception as e:
+                    display.debug("libssh: failed to close %s: %s" % (handle, to_text(e)))
+
         if cache_key in SFTP_CONNECTION_CACHE:
             return SFTP_CONNECTION_CACHE[cache_key]
         else:
@@ -604,6 +761,7 @@ class Connection(ConnectionBase):
             raise AnsibleError("Don't know how to transfer file over protocol %s" % proto)
 
     def reset(self):
+        self._opt_cache = None
         self.close()
         self._connect()
 
@@ -614,13 +772,23 @@ class Connection(ConnectionBase):
         SSH_CONNECTION_CACHE.pop(cache_key, None)
         SFTP_CONNECTION_CACHE.pop(cache_key, None)
 
-        if hasattr(self, "sftp"):
-            if self.sftp is not None:
-                self.sftp.close()
-
-        if hasattr(self, "chan"):
-            if self.chan is not None:
-                self.chan.close()
-
-        self.ssh.close()
+        handles = (
+            getattr(self, "sftp", None),
+            getattr(self, "chan", None),
+            getattr(self, "ssh", None),
+        )
+        self.sftp = self.chan = self.ssh = None
         self._connected = False
+
+        # close everything still open, then report the first failure
+        error = None
+        for handle in handles:
+            if handle is None:
+                continue
+            try:
+                handle.close()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
@@ -8,6 +8,9 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import threading
+import time
+
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -15,7 +18,7 @@ import pytest
 from ansible.errors import AnsibleError, AnsibleFileNotFound
 from ansible.module_utils._text import to_bytes
 from ansible.playbook.play_context import PlayContext
-from ansible.plugins.loader import connection_loader
+from ansible.plugins.loader import become_loader, connection_loader
 
 from ansible_collections.ansible.netcommon.plugins.connection import libssh
 
@@ -65,16 +68,82 @@ def test_libssh_connect(conn, monkeypatch):
     )
 
 
+def test_libssh_connect_concurrent(conn, monkeypatch):
+    monkeypatch.setattr(libssh, "SSH_CONNECTION_CACHE", {})
+    mock_ssh = MagicMock()
+
+    def slow_connect():
+        time.sleep(0.1)
+        return mock_ssh
+
+    conn._connect_uncached = MagicMock(side_effect=slow_connect)
+    threads = [threading.Thread(target=conn._connect) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn._connect_uncached.assert_called_once_with()
+    assert conn.ssh is mock_ssh
+
+
+def test_libssh_connect_private_key(conn, monkeypatch, tmp_path):
+    key_file = tmp_path / "id_rsa"
+    key_file.write_bytes(b"private key")
+    conn._play_context.private_key_file = str(key_file)
+    conn.set_options(direct={"remote_addr": "localhost", "remote_user": "user1"})
+
+    mock_session = MagicMock()
+    monkeypatch.setattr(libssh, "Session", mock_session)
+    monkeypatch.setattr(libssh, "_PRIVATE_KEY_CACHE", {})
+    mock_ssh = MagicMock()
+    mock_session.return_value = mock_ssh
+    read_bytes = MagicMock(side_effect=libssh.Path.read_bytes)
+    monkeypatch.setattr(libssh.Path, "read_bytes", lambda self: read_bytes(self))
+
+    # the key file is read once for any number of connects
+    conn._connect_uncached()
+    conn._connect_uncached()
+    assert mock_ssh.connect.call_args.kwargs["private_key"] == b"private key"
+    assert read_bytes.call_count == 1
+
+    # a rewritten key file replaces the cached contents
+    key_file.write_bytes(b"rotated private key")
+    conn._connect_uncached()
+    assert mock_ssh.connect.call_args.kwargs["private_key"] == b"rotated private key"
+    assert read_bytes.call_count == 2
+    assert len(libssh._PRIVATE_KEY_CACHE) == 1
+
+
 def test_libssh_close(conn):
-    conn.ssh = MagicMock()
-    conn.sftp = MagicMock()
-    conn.chan = MagicMock()
+    conn.ssh = mock_ssh = MagicMock()
+    conn.sftp = mock_sftp = MagicMock()
+    conn.chan = mock_chan = MagicMock()
+
+    conn.close()
 
+    mock_sftp.close.assert_called_once_with()
+    mock_chan.close.assert_called_once_with()
+    mock_ssh.close.assert_called_once_with()
+
+    # closing again has nothing left to close
     conn.close()
+    mock_ssh.close.assert_called_once_with()
+    assert (conn.sftp, conn.chan, conn.ssh) == (None, None, None)
+
+
+def test_libssh_close_error(conn):
+    conn.ssh = mock_ssh = MagicMock()
+    conn.chan = mock_chan = MagicMock()
+    mock_chan.close.side_effect = Exception("connection reset")
 
-    conn.sftp.close.assert_called_with()
-    conn.chan.close.assert_called_with()
-    conn.ssh.close.assert_called_with()
+    with pytest.raises(Exception, match="connection reset"):
+        conn.close()
+
+    # a failure closing the channel does not keep the session open
+    mock_chan.close.assert_called_once_with()
+    mock_ssh.close.assert_called_once_with()
+    assert conn.ssh is None
 
 
 @patch("ansible.plugins.connection.ConnectionBase.exec_command")
@@ -94,6 +163,61 @@ def test_libssh_exec_command(mocked_super, conn):
     rc, out, err = conn.exec_command(cmd="echo hello")
 
     assert (rc, out, err) == (0, "echo hello", "")
+    # no become prompt to answer, so no interactive shell is requested
+    mock_chan.request_shell.assert_not_called()
+
+
+@patch("ansible.plugins.connection.ConnectionBase.exec_command")
+def test_libssh_exec_command_become_prompt(mocked_super, conn):
+    mock_chan = MagicMock()
+    mock_chan.recv.side_effect = [
+        b"We trust you have received\n the usual lecture\nPass",
+        b"word: ",
+    ]
+    mock_chan.get_channel_exit_status.return_value = 0
+    conn.ssh = MagicMock(**{"new_channel.return_value": mock_chan})
+
+    conn.become = MagicMock()
+    conn.become.expect_prompt.return_value = True
+    conn.become.check_success.side_effect = lambda line: b"BECOME-SUCCESS" in line
+    conn.become.check_password_prompt.side_effect = lambda line: line.startswith(b"Password:")
+    conn.become.get_option.return_value = "secret"
+
+    rc, out, err = conn.exec_command(cmd="sudo ls")
+
+    assert (rc, out, err) == (0, b"", b"")
+    mock_chan.request_shell.assert_called_once_with()
+    mock_chan.sendall.assert_called_with(b"secret\n")
+
+
+@pytest.mark.parametrize(
+    "chunks, expected",
+    [
+        ([b"BECOME-", b"SUCCESS-abc\r\n"], None),
+        ([b"lecture\r\n  [sudo via ansible, key=abc] pass", b"word: "], b"secret\n"),
+        ([b"not a [sudo via ansible, key=abc] password:\n", b"BECOME-SUCCESS-abc\n"], None),
+    ],
+)
+@patch("ansible.plugins.connection.ConnectionBase.exec_command")
+def test_libssh_exec_command_become_regex(mocked_super, conn, chunks, expected):
+    mock_chan = MagicMock()
+    mock_chan.recv.side_effect = chunks
+    mock_chan.get_channel_exit_status.return_value = 0
+    conn.ssh = MagicMock(**{"new_channel.return_value": mock_chan})
+
+    conn.become = become_loader.get("sudo")
+    conn.become.set_options(direct={"become_pass": "secret"})
+    conn.become.success = "BECOME-SUCCESS-abc"
+    conn.become.prompt = "[sudo via ansible, key=abc] password:"
+    assert libssh._become_output_regex(conn.become) is not None
+
+    conn.exec_command(cmd="sudo ls")
+
+    assert mock_chan.recv.call_count == len(chunks)
+    if expected:
+        mock_chan.sendall.assert_called_with(expected)
+    else:
+        mock_chan.sendall.assert_called_once_with(b"sudo ls")
 
 
 @patch("ansible.plugins.connection.ConnectionBase.put_file")
@@ -104,15 +228,30 @@ def test_libssh_put_file_not_exist(mocked_super, conn):
 
 @patch("os.path.exists")
 @patch("ansible.plugins.connection.ConnectionBase.put_file")
-def test_libssh_put_file(mocked_super, mock_exists, conn):
+def test_libssh_put_file(mocked_super, mock_exists, conn, monkeypatch):
+    mock_session = MagicMock()
+    monkeypatch.setattr(libssh, "Session", mock_session)
+    monkeypatch.setattr(libssh, "SSH_CONNECTION_CACHE", {})
+    monkeypatch.setattr(libssh, "SFTP_CONNECTION_CACHE", {})
     mock_sftp = MagicMock()
     attr = {"sftp.return_value": mock_sftp}
     mock_ssh = MagicMock(**attr)
-    conn.ssh = mock_ssh
+    mock_session.return_value = mock_ssh
 
     file_path = "test_libssh.py"
     conn.put_file(in_path=file_path, out_path=file_path)
+    conn.put_file(in_path=file_path, out_path=file_path)
     mock_sftp.put.assert_called_with(to_bytes(file_path), to_bytes(file_path))
+    # the SFTP channel is opened once and reused for following transfers
+    mock_ssh.sftp.assert_called_once_with()
+
+    # a dropped session is closed along with its SFTP channel and not reused
+    mock_ssh.is_connected = False
+    mock_ssh.close.side_effect = Exception("already disconnected")
+    conn.put_file(in_path=file_path, out_path=file_path)
+    mock_sftp.close.assert_called_once_with()
+    mock_ssh.close.assert_called_once_with()
+    assert mock_ssh.sftp.call_count == 2
 
 
 @patch("ansible.plugins.connection.ConnectionBase.fetch_file")
@@ -129,3 +268,53 @@ def test_libssh_fetch_file(mocked_super, conn, monkeypatch):
         to_bytes(file_path),
         to_bytes(file_path),
     )
+
+
+@pytest.mark.parametrize(
+    "ssh_args",
+    [
+        '-o ProxyCommand="ssh -W %h:%p bastion"',
+        '-o "ProxyCommand ssh -W %h:%p bastion"',
+        "-o ProxyCommand='ssh -W %h:%p bastion' -o ForwardAgent=yes",
+    ],
+)
+def test_libssh_proxy_command_from_ssh_args(conn, ssh_args):
+    conn.set_options(direct={"ssh_common_args": ssh_args})
+    conn._play_context.remote_addr = "host1"
+
+    assert conn._get_proxy_command(22) == "ssh -W host1:22 bastion"
+    # the result is cached for the same inputs
+    assert conn._proxy_command_cache
+    assert conn._get_proxy_command(22) == "ssh -W host1:22 bastion"
+    assert conn._get_proxy_command(2222) == "ssh -W host1:2222 bastion"
+
+
+def test_libssh_proxy_command_option_first(conn, monkeypatch):
+    mock_display = MagicMock()
+    monkeypatch.setattr(libssh.display, "display", mock_display)
+    monkeypatch.setattr(libssh.display, "_warns", {})
+    conn.set_options(
+        direct={
+            "proxy_command": "ssh -l %r -W %h:%p jump",
+            "ssh_common_args": '-o ProxyCommand="ssh -W %h:%p bastion"',
+        }
+    )
+    conn._play_context.remote_addr = "host1"
+    conn._play_context.remote_user = "user1"
+
+    assert conn._get_proxy_command(22) == "ssh -l user1 -W host1:22 jump"
+    # the overridden ProxyCommand is reported, and Display shows it only once
+    assert conn._get_proxy_command(2222) == "ssh -l user1 -W host1:2222 jump"
+    mock_display.assert_called_once()
+    assert "The ProxyCommand set in the ssh_*_args options is ignored" in (
+        mock_display.call_args.args[0].replace("\n", " ")
+    )
+
+
+def test_libssh_opts_cache(conn):
+    conn.set_options(direct={"remote_user": "user1"})
+    assert conn._opts()["remote_user"] == "user1"
+    assert conn._opts() is conn._opts()
+
+    conn.set_options(direct={"remote_user": "user2"})
+    assert conn._opts()["remote_user"] == "user2"